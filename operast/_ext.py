@@ -4,13 +4,15 @@ __all__ = [
     "EXT_REPR",
     "ExternMethods",
     "get_ext_eq",
+    "get_ext_methods",
     "get_ext_repr",
+    "register_extern_methods",
 ]
 
 from collections.abc import Callable
 from dataclasses import dataclass
-from functools import cache
 from typing import Final, Generic, LiteralString, TypeVar
+from weakref import WeakKeyDictionary
 
 # todo: Explain why we have this mechanism using the example of AST.__eq__ not
 #  being suitably defined and the fact that monkey patching builtin types is
@@ -42,17 +44,59 @@ def _extension_type(_cls: type) -> ExternMethods | None:
     return None
 
 
-@cache
-def get_ext_eq(_cls: type[T]) -> Callable[[T, object], bool]:
+def _resolve_ext_methods(_cls: type[T]) -> ExternMethods[T]:
     eq: Callable[[T, object], bool] | None = getattr(_cls, EXT_EQUALS, None)
-    if eq is None and (extensions := _extension_type(_cls)) is not None:
-        eq = extensions.eq
-    return _cls.__eq__ if eq is None else eq
+    _repr: Callable[[T], str] | None = getattr(_cls, EXT_REPR, None)
+    if (eq is None or _repr is None) and (
+        extensions := _extension_type(_cls)
+    ) is not None:
+        eq = extensions.eq if eq is None else eq
+        _repr = extensions.repr if _repr is None else _repr
+    return ExternMethods(
+        eq=_cls.__eq__ if eq is None else eq,
+        repr=_cls.__repr__ if _repr is None else _repr,
+    )
+
+
+# Resolved methods are cached on the class itself, so that repeat lookups are a
+# single class __dict__ access. Immutable (e.g. builtin) classes cannot have
+# attributes set on them, and are cached here instead.
+_RESOLVED_ATTR: Final[LiteralString] = "__ext_methods__"
+_RESOLVED_IMMUTABLE: WeakKeyDictionary[type, ExternMethods] = WeakKeyDictionary()
+
+
+def get_ext_methods(_cls: type[T]) -> ExternMethods[T]:
+    # Look in the class __dict__ rather than using getattr, since a subclass
+    # would otherwise pick up its parent's resolved methods.
+    resolved: ExternMethods[T] | None = _cls.__dict__.get(_RESOLVED_ATTR)
+    if resolved is None:
+        resolved = _RESOLVED_IMMUTABLE.get(_cls)
+    if resolved is None:
+        resolved = _resolve_ext_methods(_cls)
+        try:
+            setattr(_cls, _RESOLVED_ATTR, resolved)
+        except TypeError:
+            _RESOLVED_IMMUTABLE[_cls] = resolved
+    return resolved
+
+
+def get_ext_eq(_cls: type[T]) -> Callable[[T, object], bool]:
+    return get_ext_methods(_cls).eq
 
 
-@cache
 def get_ext_repr(_cls: type[T]) -> Callable[[T], str]:
-    _repr: Callable[[T], str] | None = getattr(_cls, EXT_EQUALS, None)
-    if _repr is None and (extensions := _extension_type(_cls)) is not None:
-        _repr = extensions.repr
-    return _cls.__repr__ if _repr is None else _repr
+    return get_ext_methods(_cls).repr
+
+
+def register_extern_methods(_cls: type[T], methods: ExternMethods[T]) -> None:
+    EXTERN_METHODS[_cls] = methods
+    # _cls, or any of its subclasses, may have been resolved before this
+    # registration, so drop their cached resolutions before resolving _cls anew.
+    to_clear: list[type] = [_cls]
+    while to_clear:
+        typ = to_clear.pop()
+        if _RESOLVED_ATTR in typ.__dict__:
+            delattr(typ, _RESOLVED_ATTR)
+        _RESOLVED_IMMUTABLE.pop(typ, None)
+        to_clear.extend(type.__subclasses__(typ))
+    get_ext_methods(_cls)
@@ -2,23 +2,31 @@ __all__ = ["ASTElem", "Tag", "ast_strict_equals", "ast_repr", "to_pattern"]
 
 import ast
 from ast import AST
-from collections.abc import Iterator
-from itertools import zip_longest
-from operast._ext import EXTERN_METHODS, ExternMethods
+from collections.abc import Callable, Iterator
+from operast._ext import ExternMethods, register_extern_methods
 from operast.operator import Op
 from operast.tree import And, Branch, Fork, Then, Tree, TreeElem
 from typing import Any, Final
 
 AnyAST = AST | type[AST]
 
+_IS_AST_TYPE: dict[type, bool] = {}
+
+
+def is_ast_type(_cls: type) -> bool:
+    # Caches issubclass(_cls, AST) per class, so that the patterns' AST classes
+    # are each checked against the MRO once rather than on every visit.
+    is_ast = _IS_AST_TYPE.get(_cls)
+    if is_ast is None:
+        is_ast = _IS_AST_TYPE[_cls] = issubclass(_cls, AST)
+    return is_ast
+
 
 class Tag:
     __slots__ = "name", "node"
 
     def __init__(self, name: str, node: AnyAST) -> None:
-        if not (
-            isinstance(node, AST) or isinstance(node, type) and issubclass(node, AST)
-        ):
+        if not (isinstance(node, AST) or isinstance(node, type) and is_ast_type(node)):
             msg = f"node must be an instance of AST or type[AST]; found: {node}"
             raise ValueError(msg)
         self.name = name
@@ -37,20 +45,23 @@ ASTElem = AnyAST | Tag
 
 
 # noinspection PyProtectedMember
-def get_all_ast_fields() -> set[str]:
-    return {
+def get_all_ast_fields() -> frozenset[str]:
+    return frozenset(
         field
         for obj in ast.__dict__.values()
         if isinstance(obj, type) and issubclass(obj, AST)
         for field in obj._fields
-    }
+    )
 
 
-PY_AST_FIELDS: Final[set[str]] = get_all_ast_fields()
+PY_AST_FIELDS: Final[frozenset[str]] = get_all_ast_fields()
 
 
+# A node's fields can't be precomputed per AST class, since any AST field may be
+# set on a node and to_pattern deletes fields from individual nodes. Instead its
+# __dict__ is scanned once, with a set lookup rather than a getattr per field.
 def iter_ast(node: AST) -> Iterator[tuple[str, Any]]:
-    yield from ((k, v) for k, v in node.__dict__.items() if k in PY_AST_FIELDS)
+    return ((k, v) for k, v in node.__dict__.items() if k in PY_AST_FIELDS)
 
 
 def ast_fields(node: AST) -> list[tuple[str, Any]]:
@@ -148,23 +159,55 @@ def list_to_pattern(lst: list[TreeElem[ASTElem]], name: str | None) -> PatternCh
     return result, any_res
 
 
+def _class_to_pattern(_cls: type, name: str | None) -> PatternCheck:
+    if is_ast_type(_cls):
+        return ast_type_to_pattern(_cls, name)
+    return None, _cls
+
+
+def _tag_to_pattern(tag: Tag, name: str | None) -> PatternCheck:
+    return tag_to_pattern(tag)
+
+
+def _any_to_pattern(item: object, name: str | None) -> PatternCheck:
+    return None, item
+
+
+class PatternDispatch(dict[type, Callable[[Any, str | None], PatternCheck]]):
+    """Jump table from the type of an elem to its to_pattern handler"""
+
+    # Resolves the handler for each type from the same isinstance cascade that
+    # _to_pattern would otherwise run on every elem, then caches it, so each
+    # later elem of that type costs one dict lookup.
+    __slots__ = ()
+
+    def __missing__(self, cls: type) -> Callable[[Any, str | None], PatternCheck]:
+        handler: Callable[[Any, str | None], PatternCheck]
+        if issubclass(cls, type):
+            handler = _class_to_pattern
+        elif issubclass(cls, AST):
+            handler = ast_to_pattern
+        elif issubclass(cls, Tag):
+            handler = _tag_to_pattern
+        elif issubclass(cls, Branch):
+            handler = branch_to_pattern
+        elif issubclass(cls, Fork):
+            handler = fork_pattern_to_pattern
+        elif issubclass(cls, Op):
+            handler = operator_to_pattern
+        elif issubclass(cls, list):
+            handler = list_to_pattern
+        else:
+            handler = _any_to_pattern
+        self[cls] = handler
+        return handler
+
+
+_TO_PATTERN: Final[PatternDispatch] = PatternDispatch()
+
+
 def _to_pattern(item: TreeElem[ASTElem], name: str | None = None) -> PatternCheck:
-    if isinstance(item, type) and issubclass(item, AST):
-        return ast_type_to_pattern(item, name)
-    elif isinstance(item, AST):
-        return ast_to_pattern(item, name)
-    elif isinstance(item, Tag):
-        return tag_to_pattern(item)
-    elif isinstance(item, Branch):
-        return branch_to_pattern(item, name)
-    elif isinstance(item, Fork):
-        return fork_pattern_to_pattern(item, name)
-    elif isinstance(item, Op):
-        return operator_to_pattern(item, name)
-    elif isinstance(item, list):
-        return list_to_pattern(item, name)
-    else:
-        return None, item
+    return _TO_PATTERN[type(item)](item, name)
 
 
 def to_pattern(elem: TreeElem[ASTElem]) -> TreeElem[ASTElem]:
@@ -175,10 +218,19 @@ def to_pattern(elem: TreeElem[ASTElem]) -> TreeElem[ASTElem]:
 
 # todo: describe difference between strict and non-strict equals
 def ast_strict_equals(a: AnyAST, b: object) -> bool:
-    if isinstance(a, AST) and isinstance(b, AST):
-        zipped = zip_longest(iter_ast(a), iter_ast(b), fillvalue=None)
-        return type(a) is type(b) and all(i == j for i, j in zipped)
-    return a is b
+    if not isinstance(a, AST):
+        return a is b
+    if type(a) is not type(b):
+        return False
+    # Nodes of the same type may still hold different fields, so their names are
+    # compared as well as their values, but only once both lengths agree.
+    fields_a, fields_b = ast_fields(a), ast_fields(b)  # type: ignore[arg-type]
+    if len(fields_a) != len(fields_b):
+        return False
+    for (ka, va), (kb, vb) in zip(fields_a, fields_b, strict=True):
+        if ka != kb or (va is not vb and va != vb):
+            return False
+    return True
 
 
 _NV = object()
@@ -201,4 +253,4 @@ def ast_repr(elem: AnyAST) -> str:  # pragma: no cover
     return elem.__name__
 
 
-EXTERN_METHODS.update({AST: ExternMethods(eq=ast_strict_equals, repr=ast_repr)})
+register_extern_methods(AST, ExternMethods(eq=ast_strict_equals, repr=ast_repr))
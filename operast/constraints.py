@@ -1,4 +1,4 @@
-__all__ = ["Ord", "OrdElem", "Partial", "Sib", "SibElem", "Total"]
+__all__ = ["Label", "Ord", "OrdElem", "Partial", "Sib", "SibElem", "Total"]
 
 from abc import ABC, abstractmethod
 from collections import defaultdict
@@ -9,7 +9,9 @@ from typing import TypeAlias, TypeVar, Union, cast
 
 T = TypeVar("T")
 
-SibElem: TypeAlias = Union[str, "Sib"]
+# Constraints treat the labels of the nodes they constrain as opaque values.
+Label: TypeAlias = int | str
+SibElem: TypeAlias = Union[Label, "Sib"]
 
 
 class Sib(list):
@@ -24,9 +26,9 @@ class Sib(list):
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Sib):
             return False
-        return self.loc == other.loc and all(
-            a == b for a, b in zip(self, other, strict=True)
-        )
+        # list.__eq__ checks the lengths and then compares elems in C, calling
+        # back into this method only for nested Sibs.
+        return self.loc == other.loc and list.__eq__(self, other)
 
     def __ne__(self, other: object) -> bool:
         return not self == other
@@ -45,18 +47,38 @@ class Sib(list):
     # Rules:
     #   1) Sib(x, A, B) => [Sib(x, A, B)]
     #   2) Sib(x, A, Sib(y, B, C)) => [Sib(x, A, B), Sib(y, B, C)]
+    #
+    # Nested Sibs may be shared between the exprs of several disjuncts, so the
+    # rules are applied without mutating self.
+    #
+    # Sibs nest as deeply as the trees they are compiled from, so the rules are
+    # applied from an explicit stack rather than by recursion. The Sibs are
+    # first listed in pre-order, which is the order of the constraints. Then,
+    # visiting them in reverse, the first label of each is found from that of
+    # its first elem, since every nested Sib follows the Sib it is nested in.
+    # An empty Sib has no first label, and is its own constraint.
     def constraint(self) -> list["Sib"]:
-        ret = [self]
-        for i, elem in enumerate(self):
-            if isinstance(elem, Sib):
-                flattened = elem.constraint()
-                ret.extend(flattened)
-                self[i] = flattened[0][0]
+        sibs: list[Sib] = []
+        stack = [self]
+        while stack:
+            sib = stack.pop()
+            sibs.append(sib)
+            stack.extend(e for e in reversed(sib) if isinstance(e, Sib))
+        first: dict[int, Label] = {}
+        for sib in reversed(sibs):
+            if sib:
+                elem = sib[0]
+                first[id(sib)] = first[id(elem)] if isinstance(elem, Sib) else elem
+        ret = []
+        for sib in sibs:
+            head = Sib(sib.loc)
+            head.extend(first[id(e)] if isinstance(e, Sib) else e for e in sib)
+            ret.append(head)
         return ret
 
 
-OrdElem = Union[str, "Ord"]
-StrTuples = str | tuple[str, ...]
+OrdElem = Union[Label, "Ord"]
+LabelTuples = Label | tuple[Label, ...]
 
 
 def flatten_irregular(it: Iterable[T | Iterable[T]]) -> Iterator[T]:
@@ -70,6 +92,8 @@ def flatten_irregular(it: Iterable[T | Iterable[T]]) -> Iterator[T]:
 class Ord(ABC, list):
     """Constraint for tree node order"""
 
+    __slots__ = ()
+
     def __init__(self, *elems: OrdElem) -> None:
         list.__init__(self, elems)
 
@@ -86,29 +110,70 @@ class Ord(ABC, list):
         return f"{type(self).__name__}({elem_reprs})"
 
     @abstractmethod
-    def _find_paths(self) -> Iterator[list[StrTuples]]:
+    def _find_paths(self) -> Iterator[list[LabelTuples]]:
         raise NotImplementedError
 
-    def paths_product(self) -> Iterator[tuple[str, ...]]:
+    def paths_product(self) -> Iterator[tuple[Label, ...]]:
         for tup in product(*self._find_paths()):
             yield tuple(flatten_irregular(tup))
 
-    def to_dag(self) -> dict[str, set[str]]:
-        dag = defaultdict(set)
-        for links in self.paths_product():
-            for i, node in enumerate(links[:-1]):
-                dag[node].add(links[i + 1])
-            dag[links[-1]] = set()
+    # The dag is folded from each elem's sources and sinks, the labels its paths
+    # start and end with, so every elem is visited once. Enumerating the paths
+    # from paths_product would visit each elem once per path through it, and
+    # the number of paths grows with the product of the Partials' widths.
+    def to_dag(self) -> dict[Label, set[Label]]:
+        dag: defaultdict[Label, set[Label]] = defaultdict(set)
+        self._link(dag)
         return dag
 
+    @abstractmethod
+    def _link(self, dag: dict[Label, set[Label]]) -> tuple[list[Label], list[Label]]:
+        raise NotImplementedError
+
+
+def _link_elem(
+    elem: OrdElem, dag: dict[Label, set[Label]]
+) -> tuple[list[Label], list[Label]]:
+    # Adds the links within elem to dag, returning its sources and sinks.
+    if isinstance(elem, Ord):
+        return elem._link(dag)
+    if elem not in dag:
+        dag[elem] = set()
+    return [elem], [elem]
+
 
 class Total(Ord):
-    def _find_paths(self) -> Iterator[list[StrTuples]]:
+    __slots__ = ()
+
+    def _find_paths(self) -> Iterator[list[LabelTuples]]:
         for e in self:
-            yield [e] if isinstance(e, str) else list(e.paths_product())
+            yield list(e.paths_product()) if isinstance(e, Ord) else [e]
+
+    def _link(self, dag: dict[Label, set[Label]]) -> tuple[list[Label], list[Label]]:
+        sources: list[Label] = []
+        sinks: list[Label] = []
+        for i, e in enumerate(self):
+            e_sources, e_sinks = _link_elem(e, dag)
+            if i == 0:
+                sources = e_sources
+            for sink in sinks:
+                dag[sink].update(e_sources)
+            sinks = e_sinks
+        return sources, sinks
 
 
 class Partial(Ord):
-    def _find_paths(self) -> Iterator[list[StrTuples]]:
+    __slots__ = ()
+
+    def _find_paths(self) -> Iterator[list[LabelTuples]]:
         paths = (e.paths_product() if isinstance(e, Ord) else e for e in self)
         yield list(flatten_irregular(paths))
+
+    def _link(self, dag: dict[Label, set[Label]]) -> tuple[list[Label], list[Label]]:
+        sources: list[Label] = []
+        sinks: list[Label] = []
+        for e in self:
+            e_sources, e_sinks = _link_elem(e, dag)
+            sources.extend(e_sources)
+            sinks.extend(e_sinks)
+        return sources, sinks
@@ -140,21 +140,31 @@ def _get_filter_attrs(node: ast.AST) -> dict[str, ValuePredicate]:
 
 # noinspection PyUnusedLocal
 def _has_children(node: AST, scope: Scope) -> bool:
-    return next((True for _ in ast.iter_child_nodes(node)), False)
-
-
+    # Scans the node's fields directly, as ast.iter_child_nodes would, but
+    # without the two generators it drives through ast.iter_fields.
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, AST):
+            return True
+        if isinstance(value, list) and any(isinstance(v, AST) for v in value):
+            return True
+    return False
+
+
+# The filters are extracted from the template node once, when node_identity
+# builds its predicate, so only this check runs per node being matched.
 def _check_attrs(
     node: ast.AST, scope: Scope, filters: dict[str, ValuePredicate]
 ) -> bool:
-    return all(
-        predicate(getattr(node, attr, _NonValue), scope)
-        for attr, predicate in filters.items()
-    )
+    for attr, predicate in filters.items():
+        if not predicate(getattr(node, attr, _NonValue), scope):
+            return False
+    return True
 
 
 # noinspection PyUnusedLocal
 def _check_class(node: ast.AST, scope: Scope, _cls: type[ast.AST]) -> bool:
-    return issubclass(type(node), _cls)
+    return isinstance(node, _cls)
 
 
 # noinspection PyUnusedLocal
@@ -167,11 +177,22 @@ def _as_pred(e: Union["NodePredicate", ASTElem]) -> ASTPredicate:
 
 
 # This is not really a compose of all the functions, rather we have g o (f1, f2, ...)
+# Predicates only ever compose one or two functions, so those arities get their
+# own closures, which call each function directly rather than from a generator.
 def compose_n(g: Callable[..., U], *fs: Callable[..., T]) -> Callable[..., U]:
+    if len(fs) == 1:
+        (f,) = fs
+        return lambda *args, **kwargs: g(f(*args, **kwargs))
+    if len(fs) == 2:
+        f1, f2 = fs
+        return lambda *args, **kwargs: g(f1(*args, **kwargs), f2(*args, **kwargs))
     return lambda *args, **kwargs: g(*(f(*args, **kwargs) for f in fs))
 
 
 def conjoin_n(*fs: Callable[..., bool]) -> Callable[..., bool]:
+    if len(fs) == 2:
+        f1, f2 = fs
+        return lambda *args, **kwargs: f1(*args, **kwargs) and f2(*args, **kwargs)
     return lambda *args, **kwargs: all(f(*args, **kwargs) for f in fs)
 
 
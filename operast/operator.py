@@ -12,8 +12,7 @@ __all__ = [
 ]
 
 from abc import ABC, abstractmethod
-from collections.abc import Iterable, Iterator
-from itertools import zip_longest
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from operast._ext import get_ext_eq, get_ext_repr
 from operast.thompson import AnyUnit, Instruction, Jump, Match, Split, Unit, UnitList
 from typing import Generic, TypeAlias, TypeVar
@@ -36,10 +35,18 @@ class ProgramCounter:
 
 
 class Op(ABC, Generic[T]):
+    # An Op's hash is computed from its elems on each call, rather than once in
+    # __init__, for the reasons given at op_elem_eq_fn.
+    __slots__ = ()
+
     @abstractmethod
     def __eq__(self, other: object) -> bool:
         raise NotImplementedError
 
+    @abstractmethod
+    def __hash__(self) -> int:
+        raise NotImplementedError
+
     @abstractmethod
     def compile(self, pc: ProgramCounter) -> Iterator[Instruction[T]]:
         raise NotImplementedError
@@ -48,17 +55,42 @@ class Op(ABC, Generic[T]):
 OpElem: TypeAlias = T | Op[T]
 
 
-def op_elem_eq(a: OpElem[T] | None, b: OpElem[T] | None) -> bool:
+OpElemEq: TypeAlias = Callable[[OpElem[T], object], bool]
+
+
+# Op __eq__ and __hash__ both resolve the eq functions of elems through here, on
+# every call rather than once at construction, so that they always agree: elems
+# may be reassigned, and register_extern_methods may change the eq function of
+# a class, after an Op is built. The resolution itself is done once per class,
+# and cached on that class by _ext until the next registration.
+def op_elem_eq_fn(a: OpElem[T]) -> OpElemEq:
+    if isinstance(a, Op):
+        return type(a).__eq__
+    return get_ext_eq(a if isinstance(a, type) else type(a))
+
+
+def op_elems_eq(es1: Sequence[OpElem[T]], es2: Sequence[OpElem[T]]) -> bool:
+    return len(es1) == len(es2) and all(
+        op_elem_eq_fn(a)(a, b) for a, b in zip(es1, es2, strict=True)
+    )
+
+
+def op_elem_hash(a: OpElem[T]) -> int:
     if isinstance(a, Op):
-        return a == b
-    if a is None or b is None:
-        return False
-    eq = get_ext_eq(a if isinstance(a, type) else type(a))
-    return eq(a, b)
+        return hash(a)
+    _cls: type = a if isinstance(a, type) else type(a)
+    if op_elem_eq_fn(a) is not _cls.__eq__:
+        # Extension equality only ever relates elems of the same class, so
+        # hashing on the class keeps the hash consistent with op_elems_eq.
+        return hash(_cls)
+    try:
+        return hash(a)
+    except TypeError:
+        return hash(_cls)
 
 
-def op_elems_eq(es1: Iterable[OpElem[T]], es2: Iterable[OpElem[T]]) -> bool:
-    return all(op_elem_eq(a, b) for a, b in zip_longest(es1, es2, fillvalue=None))
+def op_elems_hash(es: Iterable[OpElem[T]]) -> int:
+    return hash(tuple(op_elem_hash(e) for e in es))
 
 
 def op_elem_repr(a: OpElem[T]) -> str:  # pragma: no cover
@@ -89,7 +121,10 @@ class Quantifier(Op[T], ABC):
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, type(self)):
             return False
-        return op_elems_eq(self.elems, other.elems) and self.greedy == other.greedy
+        return self.greedy == other.greedy and op_elems_eq(self.elems, other.elems)
+
+    def __hash__(self) -> int:
+        return hash((type(self), op_elems_hash(self.elems), self.greedy))
 
     def __repr__(self) -> str:
         elems_repr = ", ".join(op_elem_repr(a) for a in self.elems)
@@ -97,6 +132,8 @@ class Quantifier(Op[T], ABC):
 
 
 class Plus(Quantifier[T]):
+    __slots__ = ()
+
     def compile(self, pc: ProgramCounter) -> Iterator[Instruction[T]]:
         start = pc.val
         yield from compile_elements(self.elems, pc)
@@ -108,6 +145,8 @@ class Plus(Quantifier[T]):
 
 
 class Star(Quantifier[T]):
+    __slots__ = ()
+
     def compile(self, pc: ProgramCounter) -> Iterator[Instruction[T]]:
         start = pc.val
         pc.inc()  # increment for split
@@ -123,6 +162,8 @@ class Star(Quantifier[T]):
 
 
 class QMark(Quantifier[T]):
+    __slots__ = ()
+
     def compile(self, pc: ProgramCounter) -> Iterator[Instruction[T]]:
         pc.inc()  # increment for split
         split: Split[T] = Split(pc.val, pc.val)
@@ -148,6 +189,9 @@ class Alt(Op[T]):
             self.right, other.right
         )
 
+    def __hash__(self) -> int:
+        return hash((Alt, op_elems_hash(self.left), op_elems_hash(self.right)))
+
     def __repr__(self) -> str:
         left_repr = ", ".join(op_elem_repr(a) for a in self.left)
         right_repr = ", ".join(op_elem_repr(a) for a in self.right)
@@ -177,6 +221,9 @@ class Lst(Op[T]):
             return False
         return op_elems_eq(self.elems, other.elems)
 
+    def __hash__(self) -> int:
+        return hash((Lst, op_elems_hash(self.elems)))
+
     def __repr__(self) -> str:
         elems_repr = ", ".join(op_elem_repr(a) for a in self.elems)
         return f"{type(self).__name__}({elems_repr})"
@@ -187,9 +234,14 @@ class Lst(Op[T]):
 
 
 class Dot(Op[T]):
+    __slots__ = ()
+
     def __eq__(self, other: object) -> bool:
         return isinstance(other, Dot)
 
+    def __hash__(self) -> int:
+        return hash(Dot)
+
     def __repr__(self) -> str:
         return f"{type(self).__name__}()"
 
@@ -208,7 +260,10 @@ class Repeat(Op[T]):
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Repeat):
             return False
-        return op_elems_eq(self.elems, other.elems) and self.count == other.count
+        return self.count == other.count and op_elems_eq(self.elems, other.elems)
+
+    def __hash__(self) -> int:
+        return hash((Repeat, op_elems_hash(self.elems), self.count))
 
     def __repr__(self) -> str:
         elems_repr = ", ".join(op_elem_repr(a) for a in self.elems)
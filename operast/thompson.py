@@ -2,102 +2,405 @@ __all__ = [
     "AnyUnit",
     "Instruction",
     "Jump",
+    "LazyDFA",
     "Match",
+    "Program",
     "Split",
     "Unit",
     "UnitList",
     "UnitEq",
+    "compile_matcher",
+    "compile_program",
+    "epsilon_closure",
     "thompson_vm",
     "vm_step",
 ]
 
-from collections.abc import Callable
+from collections.abc import Callable, Hashable, Iterable
 from dataclasses import dataclass
-from typing import Generic, TypeAlias, TypeVar
+from itertools import chain, repeat
+from typing import Any, ClassVar, Final, Generic, TypeAlias, TypeVar
 
 T = TypeVar("T")
 
 UnitEq: TypeAlias = Callable[[T, T], bool]
 
+UNIT: Final[int] = 0
+UNIT_LIST: Final[int] = 1
+ANY_UNIT: Final[int] = 2
+MATCH: Final[int] = 3
+JUMP: Final[int] = 4
+SPLIT: Final[int] = 5
+
 
 class Instruction(Generic[T]):
-    pass
+    __slots__ = ()
+    opcode: ClassVar[int]
+
+    @property
+    def arg(self) -> Any:  # noqa: ANN401
+        return None
 
 
 @dataclass
 class Unit(Instruction[T]):
     __slots__ = ("e",)
+    opcode = UNIT
     e: T
 
+    @property
+    def arg(self) -> T:
+        return self.e
+
 
 @dataclass
 class UnitList(Instruction[T]):
     __slots__ = ("ls",)
+    opcode = UNIT_LIST
     ls: list[T]
 
+    @property
+    def arg(self) -> list[T]:
+        return self.ls
+
 
 @dataclass
 class AnyUnit(Instruction[T]):
-    pass
+    __slots__ = ()
+    opcode = ANY_UNIT
 
 
 @dataclass
 class Match(Instruction[T]):
-    pass
+    __slots__ = ()
+    opcode = MATCH
 
 
 @dataclass
 class Jump(Instruction[T]):
     __slots__ = ("goto",)
+    opcode = JUMP
     goto: int
 
+    @property
+    def arg(self) -> int:
+        return self.goto
+
 
 @dataclass
 class Split(Instruction[T]):
     __slots__ = "t1", "t2"
+    opcode = SPLIT
     t1: int
     t2: int
 
+    @property
+    def arg(self) -> tuple[int, int]:
+        return self.t1, self.t2
+
+
+# A program compiled to parallel lists of opcodes and their args, so that the VM
+# dispatches on integer compares rather than on an isinstance chain, and reads
+# each instruction's arg without an attribute lookup. The third list holds the
+# epsilon closure of each pc: the pcs of the consuming instructions, and Match,
+# reachable from it by following only Jumps and Splits, in priority order.
+Program: TypeAlias = tuple[list[int], list[Any], list[tuple[int, ...]]]
+
+
+def compile_program(program: list[Instruction[T]]) -> Program:
+    ops = [inst.opcode for inst in program]
+    args = [inst.arg for inst in program]
+    # The units of each UnitList are frozen to a tuple, and UnitLists of the
+    # same units, by identity, share a single tuple across the program.
+    unit_lists: dict[tuple[int, ...], tuple[T, ...]] = {}
+    for pc, op in enumerate(ops):
+        if op == UNIT_LIST:
+            units = tuple(args[pc])
+            args[pc] = unit_lists.setdefault(tuple(map(id, units)), units)
+    closures = [epsilon_closure(ops, args, pc) for pc in range(len(program))]
+    return ops, args, closures
+
+
+def epsilon_closure(ops: list[int], args: list[Any], pc: int) -> tuple[int, ...]:
+    closure: list[int] = []
+    seen: set[int] = set()
+    stack = [pc]
+    while stack:
+        pc = stack.pop()
+        if pc in seen:
+            continue
+        seen.add(pc)
+        op = ops[pc]
+        if op == JUMP:
+            stack.append(args[pc])
+        elif op == SPLIT:
+            t1, t2 = args[pc]
+            stack.extend((t2, t1))
+        else:
+            closure.append(pc)
+    return tuple(closure)
 
-__NO_MATCH = object()
+
+_NO_MATCH = object()
 
 
 # todo: fix threading
-def thompson_vm(program: list[Instruction[T]], sequence: list[T], eq: UnitEq) -> bool:
-    c_list: list[int] = [0]
-    for item in [*sequence, __NO_MATCH]:
-        step = vm_step(program, c_list, item, eq)
-        if step is None:
+def thompson_vm(
+    program: list[Instruction[T]], sequence: Iterable[T], eq: UnitEq
+) -> bool:
+    compiled = compile_program(program)
+    # Each step reads its threads from one buffer and writes the next step's to
+    # the other, and the two are then swapped, so no lists are built per step.
+    # Since each pc is added at most once per step, neither can overflow.
+    size = len(program)
+    c_buf, n_buf, stamps = [0] * size, [0] * size, [0] * size
+    start = compiled[2][0]
+    c_len = len(start)
+    c_buf[:c_len] = start
+    stamp = 0
+    # The sequence is iterated as given, rather than copied with _NO_MATCH
+    # appended, and the final step past its end is taken after the loop.
+    for stamp, item in enumerate(sequence, 1):
+        n_len = _step_into(compiled, c_buf, c_len, item, eq, n_buf, stamps, stamp)
+        if n_len == _MATCHED:
             return True
-        if len(step) == 0:
+        if n_len == 0:
             return False
-        c_list = step
-    return False
+        c_buf, n_buf, c_len = n_buf, c_buf, n_len
+    end = _step_into(compiled, c_buf, c_len, _NO_MATCH, eq, n_buf, stamps, stamp + 1)
+    return end == _MATCHED
 
 
 def vm_step(
     program: list[Instruction[T]], c_list: list[int], item: T, eq: UnitEq
 ) -> list[int] | None:
-    n_list: list[int] = []
-    for program_counter in c_list:
-        inst = program[program_counter]
-        if isinstance(inst, Unit):
-            if item is __NO_MATCH or not eq(item, inst.e):
+    """Steps the threads at the pcs of c_list over item"""
+    # c_list may hold any pcs of program, and each is replaced by its epsilon
+    # closure before the step. The returned n_list holds only the pcs of those
+    # closures, so it can be passed straight back in for the next item.
+    compiled = _compile_cached(program)
+    closures = compiled[2]
+    closed = list(dict.fromkeys(chain.from_iterable(closures[pc] for pc in c_list)))
+    return _vm_step(compiled, closed, item, eq)
+
+
+# The compiled form of the program last given to vm_step is kept, so that the
+# steps of one sequence compile their program only once. Instructions are
+# mutable, so the program is checked against a snapshot of its opcodes and args
+# on each step, which costs less than recompiling its epsilon closures.
+_Compiled: TypeAlias = tuple[list[Instruction[Any]], list[tuple[int, Any]], Program]
+_COMPILED: dict[int, _Compiled] = {}
+
+
+def _compile_cached(program: list[Instruction[T]]) -> Program:
+    snapshot = [(inst.opcode, inst.arg) for inst in program]
+    cached = _COMPILED.get(id(program))
+    if cached is not None and cached[0] is program and cached[1] == snapshot:
+        return cached[2]
+    compiled = compile_program(program)
+    _COMPILED.clear()
+    _COMPILED[id(program)] = program, snapshot, compiled
+    return compiled
+
+
+# c_list must only hold the pcs of consuming instructions and Match, as found in
+# the epsilon closures of a compiled program; the returned n_list does too. Jumps
+# and Splits are never followed at runtime, and each pc is added to n_list at
+# most once, so a step does work bounded by the size of the program. A Jump or
+# Split in c_list raises ValueError.
+def _vm_step(
+    program: Program, c_list: list[int], item: T, eq: UnitEq
+) -> list[int] | None:
+    if not c_list:
+        return []
+    size = len(program[0])
+    n_buf, stamps = [0] * size, [0] * size
+    n_len = _step_into(program, c_list, len(c_list), item, eq, n_buf, stamps, 1)
+    return None if n_len == _MATCHED else n_buf[:n_len]
+
+
+_MATCHED: Final[int] = -1
+
+
+# Steps the first c_len threads of c_buf, writing the next step's threads to the
+# start of n_buf and returning how many there are, or _MATCHED. A pc is already
+# in n_buf iff its entry in stamps equals stamp, so the stamps need not be reset
+# between steps as long as each step is given a new stamp.
+def _step_into(
+    program: Program,
+    c_buf: list[int],
+    c_len: int,
+    item: object,
+    eq: UnitEq,
+    n_buf: list[int],
+    stamps: list[int],
+    stamp: int,
+) -> int:
+    ops, args, closures = program
+    n_len = 0
+    for i in range(c_len):
+        program_counter = c_buf[i]
+        op = ops[program_counter]
+        if op == UNIT:
+            if item is _NO_MATCH or not eq(item, args[program_counter]):
                 continue
-            n_list.append(program_counter + 1)
-        elif isinstance(inst, UnitList):
-            if item is __NO_MATCH or not any(eq(item, i) for i in inst.ls):
+        elif op == UNIT_LIST:
+            # map over repeat runs the comparisons without a generator frame.
+            ls = args[program_counter]
+            if item is _NO_MATCH or not any(map(eq, repeat(item), ls)):
                 continue
-            n_list.append(program_counter + 1)
-        elif isinstance(inst, AnyUnit):
-            n_list.append(program_counter + 1)
-        elif isinstance(inst, Match):
-            return None
-        elif isinstance(inst, Jump):
-            c_list.append(inst.goto)
-        elif isinstance(inst, Split):
-            c_list.extend([inst.t1, inst.t2])
-        else:  # pragma: no cover
-            msg = "Unreachable!"
+        elif op == ANY_UNIT:
+            pass
+        elif op == MATCH:
+            return _MATCHED
+        else:
+            msg = (
+                f"Thread at pc {program_counter} is a Jump or Split; threads must "
+                "only hold the pcs found in epsilon closures"
+            )
             raise ValueError(msg)
-    return n_list
+        # The instruction consumed item, so its thread moves on to the closure
+        # of the next pc.
+        for next_pc in closures[program_counter + 1]:
+            if stamps[next_pc] != stamp:
+                stamps[next_pc] = stamp
+                n_buf[n_len] = next_pc
+                n_len += 1
+    return n_len
+
+
+Matcher: TypeAlias = Callable[[Iterable[T], UnitEq], bool]
+
+
+def compile_matcher(program: list[Instruction[T]]) -> Matcher:
+    """Specialises the VM to program, as a function of a sequence and eq"""
+    # The threads of a step are held as a bitmask over the pcs, in which only
+    # consuming instructions and Match are ever set, as in the epsilon closures.
+    # Whether a match is found doesn't depend on the order of the threads, so
+    # the generated function tests each consuming pc in turn, with its units
+    # and the mask of the closure of its next pc inlined, and no dispatch.
+    ops, args, closures = compile_program(program)
+
+    def mask(pcs: Iterable[int]) -> int:
+        return sum(1 << pc for pc in set(pcs))
+
+    matched = mask(pc for pc, op in enumerate(ops) if op == MATCH)
+    namespace: dict[str, Any] = {}
+    lines = [
+        "def match(sequence, eq):",
+        f"    threads = {mask(closures[0])}",
+        "    for item in sequence:",
+        f"        if threads & {matched}:",
+        "            return True",
+        "        next_threads = 0",
+    ]
+    for pc, op in enumerate(ops):
+        if op == UNIT:
+            namespace[f"u{pc}"] = args[pc]
+            test = f" and eq(item, u{pc})"
+        elif op == UNIT_LIST:
+            for i, unit in enumerate(args[pc]):
+                namespace[f"u{pc}_{i}"] = unit
+            units = " or ".join(f"eq(item, u{pc}_{i})" for i in range(len(args[pc])))
+            test = f" and ({units or 'False'})"
+        elif op == ANY_UNIT:
+            test = ""
+        else:
+            # Match is tested once per step, above, and Jumps and Splits never
+            # appear in a closure.
+            continue
+        lines += [
+            f"        if threads & {1 << pc}{test}:",
+            f"            next_threads |= {mask(closures[pc + 1])}",
+        ]
+    lines += [
+        "        if not next_threads:",
+        "            return False",
+        "        threads = next_threads",
+        f"    return bool(threads & {matched})",
+    ]
+    exec(compile("\n".join(lines), "<thompson matcher>", "exec"), namespace)
+    matcher: Matcher = namespace["match"]
+    return matcher
+
+
+# Sentinel state ids, for the steps that reach a Match, or that leave no threads.
+_ACCEPT: Final[int] = -1
+_REJECT: Final[int] = -2
+
+
+class LazyDFA(Generic[T]):
+    """Matches sequences against a program, building its DFA lazily"""
+
+    # Each DFA state is the c_list of a step, and states are numbered as they
+    # are first reached. The step from a state on an item is cached under the
+    # key of that item, so matching many sequences against the same program
+    # only runs _vm_step for transitions it has not yet seen. This is only sound
+    # if eq(item, unit) depends on nothing but key(item), for every unit.
+    __slots__ = (
+        "_program",
+        "_eq",
+        "_key",
+        "_max_transitions",
+        "_states",
+        "_state_ids",
+        "_transitions",
+    )
+
+    def __init__(
+        self,
+        program: list[Instruction[T]],
+        eq: UnitEq,
+        key: Callable[[T], Hashable] | None = None,
+        max_transitions: int = 4096,
+    ) -> None:
+        self._program = compile_program(program)
+        self._eq = eq
+        self._key = key
+        self._max_transitions = max_transitions
+        self._states: list[tuple[int, ...]] = []
+        self._state_ids: dict[tuple[int, ...], int] = {}
+        self._transitions: dict[tuple[int, Hashable], int] = {}
+
+    def _state_id(self, c_list: tuple[int, ...]) -> int:
+        state_id = self._state_ids.get(c_list)
+        if state_id is None:
+            state_id = self._state_ids[c_list] = len(self._states)
+            self._states.append(c_list)
+        return state_id
+
+    def _flush(self, state_id: int) -> int:
+        c_list = self._states[state_id]
+        self._transitions.clear()
+        self._states.clear()
+        self._state_ids.clear()
+        return self._state_id(c_list)
+
+    def _step(self, state_id: int, item: T) -> int:
+        c_list = list(self._states[state_id])
+        step = _vm_step(self._program, c_list, item, self._eq)
+        if step is None:
+            return _ACCEPT
+        return self._state_id(tuple(step)) if step else _REJECT
+
+    def match(self, sequence: Iterable[T]) -> bool:
+        transitions, key = self._transitions, self._key
+        max_transitions = self._max_transitions
+        state_id = self._state_id(self._program[2][0])
+        items: Iterable[Any] = chain(sequence, (_NO_MATCH,))
+        for item in items:
+            item_key = item if key is None or item is _NO_MATCH else key(item)
+            next_id = transitions.get((state_id, item_key))
+            if next_id is None:
+                # The cache is bounded by starting afresh whenever it is full,
+                # even in the middle of a sequence, keeping only the state the
+                # match is in.
+                if len(transitions) >= max_transitions:
+                    state_id = self._flush(state_id)
+                next_id = transitions[state_id, item_key] = self._step(state_id, item)
+            if next_id == _ACCEPT:
+                return True
+            if next_id == _REJECT:
+                return False
+            state_id = next_id
+        return False
@@ -10,40 +10,82 @@ __all__ = [
     "compile_tree",
 ]
 
-from abc import ABC, abstractmethod
-from collections.abc import Iterable, Iterator
-from itertools import product, zip_longest
+from collections.abc import Callable, Iterator
+from itertools import chain, product, repeat
 from operast._ext import get_ext_eq, get_ext_repr
 from operast.constraints import Ord, OrdElem, Partial, Sib, SibElem, Total
-from operast.operator import Op
-from typing import Generic, TypeAlias, TypeVar
+from operast.operator import Op, op_elem_hash
+from operator import eq
+from typing import Any, ClassVar, Final, Generic, Self, TypeAlias, TypeVar
 
 T = TypeVar("T")
+R = TypeVar("R")
 
 TreeElem: TypeAlias = Op[T] | T | "Tree[T]"
-Aliases: TypeAlias = dict[str, "Branch[T]"]
+Aliases: TypeAlias = dict[int, "Branch[T]"]
+Expr: TypeAlias = tuple[Aliases, SibElem, OrdElem]
 
 
 def tree_elem_eq(a: TreeElem[T], b: TreeElem[T]) -> bool:
-    if isinstance(a, Tree | Op):
-        return a == b
-    eq = get_ext_eq(a if isinstance(a, type) else type(a))
-    return eq(a, b)
+    return _ELEM_EQ[type(a)](a, b)
 
 
 def tree_elem_repr(a: TreeElem[T]) -> str:
-    if isinstance(a, Tree | Op):
-        return repr(a)
-    _repr = get_ext_repr(a if isinstance(a, type) else type(a))
-    return _repr(a)
+    return _ELEM_REPR[type(a)](a)
 
 
-class Tree(ABC, list, Generic[T]):
+class Tree(Generic[T]):
+    # Tree is deliberately not an ABC; isinstance checks against ABCs go through
+    # ABCMeta.__instancecheck__, and Tree is checked against in every hot loop.
+    # Its concrete subclasses override each of the stub methods below.
+    #
+    # Trees hold their elems by composition rather than by inheriting from
+    # list; a list subclass always carries an instance __dict__, whereas a
+    # fully slotted hierarchy does not.
+    __slots__ = ("_items",)
+
+    # Integer tag for the concrete Tree classes. Loops that only ever see Trees
+    # compare tags rather than calling isinstance against each class in turn.
+    kind: ClassVar[int] = 0
+
+    _items: list
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index: int | slice) -> Any:  # noqa: ANN401
+        return self._items[index]
+
+    def __setitem__(self, index: int, value: Any) -> None:  # noqa: ANN401
+        self._items[index] = value
+
     def __eq__(self, other: object) -> bool:
-        if not isinstance(other, Tree):
-            return False
-        zipped = zip_longest(self, other, fillvalue=None)
-        return type(self) is type(other) and all(tree_elem_eq(i, j) for i, j in zipped)
+        # Canonicalisation shares subtrees between the disjuncts it builds, so
+        # equal subtrees are often the same object, and compare by identity.
+        if self is other:
+            return True
+        # Nested Trees are compared from an explicit stack rather than through
+        # recursive calls to __eq__, so comparing deep trees is not limited by
+        # the recursion limit.
+        stack: list[tuple[Tree, object]] = [(self, other)]
+        while stack:
+            tree, other = stack.pop()
+            if not isinstance(other, Tree) or type(tree) is not type(other):
+                return False
+            items, other_items = tree._items, other._items
+            if len(items) != len(other_items):
+                return False
+            for i, j in zip(items, other_items, strict=True):
+                if i is j:
+                    continue
+                if isinstance(i, Tree):
+                    stack.append((i, j))
+                elif not tree_elem_eq(i, j):
+                    return False
+        return True
 
     def __ne__(self, other: object) -> bool:
         return not self == other
@@ -72,110 +114,452 @@ class Tree(ABC, list, Generic[T]):
     #   7) And(x, Or(y1, y2)) => Or(And(x, y1), And(x, y2))
     #   8) Then(x, Or(y1, y2)) => Or(Then(x, y1), Then(x, y2))
     #
-    @abstractmethod
     def canonical_nf(self, loc: int = 0, *elems: TreeElem[T]) -> "Tree[T]":
-        raise NotImplementedError
-
-    @abstractmethod
+        return self._normalise(loc, elems, _leaf_tree, _combine_trees)
+
+    # Equivalent to self.canonical_nf(loc, *elems).to_exprs(), but the exprs are
+    # emitted during normalisation rather than from an intermediate normalised
+    # tree, so only one walk is made and no new Fork instances are built.
+    def normalise_and_emit(
+        self, loc: int = 0, *elems: TreeElem[T]
+    ) -> Iterator[tuple[Aliases, SibElem, OrdElem]]:
+        exprs: list[Expr] = self._normalise(loc, elems, _leaf_exprs, _combine_exprs)
+        return iter(exprs)
+
+    def _normalise(
+        self,
+        loc: int,
+        elems: tuple[TreeElem[T], ...],
+        leaf: Callable[["Branch[T]"], R],
+        combine: Callable[["Tree[T]", list[R], int], R],
+    ) -> R:
+        # The rules are applied by an explicit post-order walk rather than by
+        # recursion, so that deeply nested trees cannot exhaust the stack. Each
+        # frame is either a tree to normalise under a loc and prefix elems or,
+        # when its elems are None, a Fork whose elems' results are on the end of
+        # results and are now to be combined. Leaf Branches give their results
+        # through leaf, and Forks through combine, so that the same walk builds
+        # both the normalised tree and, fused, its exprs.
+        results: list[R] = []
+        stack: list[tuple[Tree[T], int, tuple[TreeElem[T], ...] | None]]
+        stack = [(self, loc, elems)]
+        # The bound methods used on every step are loaded once, up front.
+        pop, push, push_all = stack.pop, stack.append, stack.extend
+        emit = results.append
+        # A Branch may be shared, appearing more than once in the tree, but its
+        # copies in the normalised tree must not share an id, or their aliases
+        # would collide in to_exprs. So each copy after the first gets a new id.
+        emitted: set[int] = set()
+        while stack:
+            tree, loc, prefix = pop()
+            if prefix is None:
+                start = len(results) - len(tree)
+                norms = results[start:]
+                del results[start:]
+                emit(combine(tree, norms, loc))
+                continue
+            # Rules 1, 2, 4 and 6 each pass the loc and prefix elems on to a
+            # single elem, so they are followed here without pushing a frame.
+            while True:
+                items = tree._items
+                if tree.kind == BRANCH:
+                    last = items[-1]
+                    if not isinstance(last, Tree):
+                        _id = tree.id  # type: ignore[attr-defined]
+                        if _id in emitted:
+                            _id = Branch._next_id()
+                            tree = tree._prefixed(prefix, _id)  # type: ignore[attr-defined]
+                        elif prefix:
+                            tree = tree._prefixed(prefix, _id)  # type: ignore[attr-defined]
+                        emitted.add(_id)
+                        emit(leaf(tree))  # type: ignore[arg-type]
+                        break
+                    loc += len(items) - 1
+                    prefix = (*prefix, *items[:-1])
+                    tree = last
+                elif len(items) == 1:
+                    tree = items[0]
+                else:
+                    if tree.kind == OR:
+                        distinct = distinct_elems(items)
+                        if distinct is not items:
+                            tree = Or._from_trees(distinct)
+                            continue
+                    push((tree, loc, None))
+                    push_all((e, loc, prefix) for e in reversed(items))
+                    break
+        return results[0]
+
+    # .to_exprs must only be called after .canonical_nf has been called, when
+    # Ors are only found at the root and every other Tree has a single expr.
+    # The exprs are rebuilt on every call rather than cached on the tree, since
+    # Trees are mutable and share subtrees, so no node could tell when a cache
+    # held by it or by one of its ancestors had gone stale.
     def to_exprs(self) -> Iterator[tuple[Aliases, SibElem, OrdElem]]:
-        raise NotImplementedError
+        stack: list[Tree[T]] = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.kind == OR:
+                stack.extend(reversed(tree._items))
+            else:
+                yield _expr(tree)
+
+
+BRANCH: Final[int] = 1
+AND: Final[int] = 2
+THEN: Final[int] = 3
+OR: Final[int] = 4
 
 
 class Branch(Tree[T]):
     __slots__ = ("id",)
+    kind = BRANCH
     id_count: int = 0
 
     def __init__(self, elem: TreeElem[T], *elems: TreeElem[T]) -> None:
-        list.__init__(self, [elem, *elems])
-        self.id = f"B{Branch.id_count}"
-        Branch.id_count += 1
-        if any(isinstance(e, Tree) for e in self[:-1]):
+        self._items = [elem, *elems]
+        self.id: int = Branch._next_id()
+        # map over repeat runs the isinstance checks without a generator frame,
+        # and a Branch of one elem has nothing to check.
+        if elems and any(map(isinstance, self._items[:-1], repeat(Tree))):
             msg = (
                 f"{Branch.__name__} may only contain {Tree.__name__} "
                 f"instances at the end of elems; found: {self}"
             )
             raise ValueError(msg)
 
-    def canonical_nf(self, loc: int = 0, *elems: TreeElem[T]) -> Tree[T]:
-        *rest, last = self
-        if isinstance(last, Tree):
-            return last.canonical_nf(loc + len(rest), *elems, *rest)
-        self[:0] = elems
-        return self
+    @classmethod
+    def _leaf(cls, elem: TreeElem[T]) -> Self:
+        # Forks wrap each of their elems that is not a Tree in a Branch. With
+        # one elem that is not a Tree there is nothing for __init__ to check.
+        branch = cls.__new__(cls)
+        branch._items = [elem]
+        branch.id = Branch._next_id()
+        return branch
+
+    @staticmethod
+    def _next_id() -> int:
+        _id = Branch.id_count
+        Branch.id_count += 1
+        return _id
+
+    def _prefixed(self, elems: tuple[TreeElem[T], ...], _id: int) -> "Branch[T]":
+        # The prefixed Branch is a new node, so that canonical_nf never mutates
+        # the tree it normalises. It is given the id of the Branch it was built
+        # from, since it stands in for that Branch in the normalised tree, unless
+        # canonical_nf has already emitted a copy of that Branch.
+        branch: Branch[T] = Branch.__new__(Branch)
+        branch._items = [*elems, *self._items]
+        branch.id = _id
+        return branch
 
-    def to_exprs(self) -> Iterator[tuple[Aliases, SibElem, OrdElem]]:
-        yield {self.id: self}, self.id, self.id
+    @property
+    def label(self) -> str:
+        return f"B{self.id}"
 
 
 FT = TypeVar("FT", bound="Fork")
 
 
-def flat(t: type[FT], elems: Iterable[Tree[T]], loc: int) -> Iterator[Tree[T]]:
+def flat_scan(
+    t: type[FT], elems: list[Tree[T]], loc: int
+) -> tuple[list[Tree[T]], list[int]]:
+    # Splices the elems of each elem that is a Fork of type t and loc into one
+    # list, extending it in place, and also returns the kinds of the flattened
+    # elems, taken from the kinds already held by any flattened Fork. Matching
+    # the kind of the Fork class t implies that elem is a Fork too.
+    kind = t.kind
+    kinds = [e.kind for e in elems]
+    if kind not in kinds:
+        # Nothing can be spliced, which is the common case for trees already
+        # in canonical form, so elems is returned as is rather than copied.
+        return elems, kinds
+    flattened: list[Tree[T]] = []
+    kinds = []
+    add, add_all = flattened.append, flattened.extend
+    add_kind, add_kinds = kinds.append, kinds.extend
     for elem in elems:
-        if isinstance(elem, t) and loc == elem.loc:
-            yield from elem
+        elem_kind = elem.kind
+        if elem_kind == kind and loc == elem.loc:  # type: ignore[attr-defined]
+            add_all(elem._items)
+            add_kinds(elem._kinds)  # type: ignore[attr-defined]
+        else:
+            add(elem)
+            add_kind(elem_kind)
+    return flattened, kinds
+
+
+def distinct_elems(trees: list[Tree[T]]) -> list[Tree[T]]:
+    # Drops each elem of an Or that duplicates an earlier one, by the rule that
+    # Or(x, x) => Or(x), returning trees itself if none do. Branches of leaves
+    # alone are compared by structure, but any other Tree only by identity,
+    # since Tree equality ignores the locs of the Forks within them.
+    kept: list[Tree[T]] = []
+    seen: dict[object, list[Tree[T]]] = {}
+    for tree in trees:
+        items = tree._items
+        if tree.kind == BRANCH and not isinstance(items[-1], Tree):
+            key: object = tuple(map(op_elem_hash, items))
         else:
-            yield elem
+            key = id(tree)
+        same = seen.setdefault(key, [])
+        if any(tree is other or tree == other for other in same):
+            continue
+        same.append(tree)
+        kept.append(tree)
+    return trees if len(kept) == len(trees) else kept
+
 
+class Fork(Tree[T]):
+    # The kinds of a Fork's elems are held in a list parallel to the elems, so
+    # that canonicalisation can test for, and branch on, Ors among the elems
+    # without loading the kind attribute of each of them.
+    __slots__ = "loc", "_kinds"
 
-class Fork(Tree[T], ABC):
-    __slots__ = ("loc",)
+    _items: list[Tree[T]]
+    order: ClassVar[type[Ord]] = Partial
 
     def __init__(self, elem: TreeElem[T], *elems: TreeElem[T], loc: int = 0) -> None:
-        trees = (e if isinstance(e, Tree) else Branch(e) for e in (elem, *elems))
-        list.__init__(self, trees)
+        trees = (e if isinstance(e, Tree) else Branch._leaf(e) for e in (elem, *elems))
+        self._items = list(trees)
+        self._kinds: list[int] = [t.kind for t in self._items]
         self.loc: int = loc
 
-    @property
-    def order(self) -> type[Ord]:
-        return Partial
-
-    def canonical_nf(self, loc: int = 0, *elems: TreeElem[T]) -> Tree[T]:
-        if len(self) == 1:
-            return self[0].canonical_nf(loc, *elems)
-        norms = (e.canonical_nf(loc, *elems) for e in self)
-        new = type(self)(*flat(type(self), norms, loc), loc=loc)
-        if any(isinstance(e, Or) for e in new):
-            return Or(*new._disjunctive_normalise(loc))
-        return new
-
-    def _disjunctive_normalise(self, loc: int) -> Iterator[Tree[T]]:
-        splat_or = (e if isinstance(e, Or) else [e] for e in self)
-        for elems in product(*splat_or):
-            yield type(self)(*flat(type(self), elems, loc), loc=loc)
-
-    def to_exprs(self) -> Iterator[tuple[Aliases, SibElem, OrdElem]]:
-        # The call to next may be used blindly since after canonical_nf has
-        # been called, the elems of And and Then will only include Branch, And
-        # and Then, each of which only ever yields a single tuple.
-        alias_iter, sib_iter, ord_iter = zip(
-            *(next(e.to_exprs()) for e in self), strict=True
-        )
-        aliases = dict(t for d in alias_iter for t in d.items())
-        sib = Sib(self.loc, *sib_iter)
-        order = self.order(*ord_iter)
-        yield aliases, sib, order
+    def __setitem__(self, index: int, value: TreeElem[T]) -> None:
+        tree = value if isinstance(value, Tree) else Branch._leaf(value)
+        self._items[index] = tree
+        self._kinds[index] = tree.kind
+
+    @classmethod
+    def _from_trees(
+        cls, trees: list[Tree[T]], loc: int = 0, kinds: list[int] | None = None
+    ) -> Self:
+        # Canonicalisation only ever builds Forks from elems that are already
+        # Trees, and shares those Trees between the disjuncts of an expansion.
+        # Skipping __init__ avoids re-checking, and copying, each of them.
+        fork = cls.__new__(cls)
+        fork._items = trees
+        fork._kinds = [t.kind for t in trees] if kinds is None else kinds
+        fork.loc = loc
+        return fork
+
+    def _combine(self, norms: list[Tree[T]], loc: int) -> Tree[T]:
+        # Combines the normalised elems of a Fork of more than one elem.
+        flattened, kinds = flat_scan(type(self), norms, loc)
+        if OR in kinds:
+            # The disjuncts are built straight from the flattened elems, so
+            # no intermediate Fork is needed. Trivial single-alternative Ors
+            # never reach this point, since canonical_nf unwraps them.
+            disjuncts = self._disjunctive_normalise(flattened, kinds, loc)
+            return Or._from_trees(list(disjuncts))
+        return type(self)._from_trees(flattened, loc, kinds)
+
+    def _disjunctive_normalise(
+        self, elems: list[Tree[T]], kinds: list[int], loc: int
+    ) -> Iterator[Tree[T]]:
+        # Enumerates the same sequence as product(*splat_or), using a
+        # mixed-radix counter over the Or alternatives. Each alternative is
+        # flattened once up front, so advancing the counter only swaps the
+        # slots whose digits rolled over rather than re-flattening every elem.
+        t = type(self)
+        kind = t.kind
+        if kinds.count(OR) == 1:
+            # With a single Or there is no product to enumerate; each of its
+            # alternatives is spliced between the same head and tail elems.
+            i = kinds.index(OR)
+            head, tail = elems[:i], elems[i + 1 :]
+            head_kinds, tail_kinds = kinds[:i], kinds[i + 1 :]
+            alt = elems[i]
+            for a, ak in zip(alt._items, alt._kinds, strict=True):  # type: ignore[attr-defined]
+                if ak == kind and a.loc == loc:
+                    trees = [*head, *a._items, *tail]
+                    yield t._from_trees(
+                        trees, loc, [*head_kinds, *a._kinds, *tail_kinds]
+                    )
+                else:
+                    trees = [*head, a, *tail]
+                    yield t._from_trees(trees, loc, [*head_kinds, ak, *tail_kinds])
+            return
+        pools: list[list[tuple[list[Tree[T]], list[int]]]] = []
+        for e, k in zip(elems, kinds, strict=True):
+            alts = zip(e._items, e._kinds, strict=True) if k == OR else ((e, k),)  # type: ignore[attr-defined]
+            pools.append(
+                [
+                    (a._items, a._kinds) if ak == kind and a.loc == loc else ([a], [ak])  # type: ignore[union-attr]
+                    for a, ak in alts
+                ]
+            )
+        slots = [pool[0] for pool in pools]
+        # Only the slots with more than one alternative can ever roll over, so
+        # the counter's digits range over those alone, least significant first.
+        radix = [
+            (i, pools[i]) for i in reversed(range(len(pools))) if len(pools[i]) > 1
+        ]
+        digits = [0] * len(radix)
+        while True:
+            trees = list(chain.from_iterable(items for items, _ in slots))
+            yield t._from_trees(trees, loc, [k for _, ks in slots for k in ks])
+            for d, (i, pool) in enumerate(radix):
+                digits[d] += 1
+                if digits[d] < len(pool):
+                    slots[i] = pool[digits[d]]
+                    break
+                digits[d] = 0
+                slots[i] = pool[0]
+            else:
+                return
 
 
 class And(Fork[T]):
-    pass
+    __slots__ = ()
+    kind = AND
 
 
 class Then(Fork[T]):
-    @property
-    def order(self) -> type[Ord]:
-        return Total
+    __slots__ = ()
+    kind = THEN
+    order = Total
 
 
 class Or(Fork[T]):
-    def canonical_nf(self, loc: int = 0, *elems: TreeElem[T]) -> Tree[T]:
-        norms = (e.canonical_nf(loc, *elems) for e in self)
-        return next(norms) if len(self) == 1 else Or(*flat(Or, norms, 0))
+    __slots__ = ()
+    kind = OR
 
-    def to_exprs(self) -> Iterator[tuple[Aliases, SibElem, OrdElem]]:
-        for elem in self:
-            yield from elem.to_exprs()
+    def _combine(self, norms: list[Tree[T]], loc: int) -> Tree[T]:
+        flattened, kinds = flat_scan(Or, norms, 0)
+        return Or._from_trees(flattened, 0, kinds)
+
+
+def _type_elem_eq(a: type[Any], b: object) -> bool:
+    return get_ext_eq(a)(a, b)
+
+
+def _instance_elem_eq(a: object, b: object) -> bool:
+    return get_ext_eq(type(a))(a, b)
+
+
+def _type_elem_repr(a: type[Any]) -> str:
+    return get_ext_repr(a)(a)
+
+
+def _instance_elem_repr(a: object) -> str:
+    return get_ext_repr(type(a))(a)
+
+
+class ElemDispatch(dict[type, Callable[..., Any]]):
+    """Jump table from the type of a TreeElem to its eq or repr handler"""
+
+    # Only the kind of handler is cached per type, never the extern method it
+    # resolves to, so registering extern methods later cannot leave it stale.
+    __slots__ = ("native", "of_type", "of_instance")
+
+    def __init__(
+        self,
+        native: Callable[..., Any],
+        of_type: Callable[..., Any],
+        of_instance: Callable[..., Any],
+    ) -> None:
+        super().__init__()
+        self.native = native
+        self.of_type = of_type
+        self.of_instance = of_instance
+
+    def __missing__(self, cls: type) -> Callable[..., Any]:
+        if issubclass(cls, (Tree, Op)):
+            handler = self.native
+        elif issubclass(cls, type):
+            handler = self.of_type
+        else:
+            handler = self.of_instance
+        self[cls] = handler
+        return handler
+
+
+_ELEM_EQ: Final[ElemDispatch] = ElemDispatch(eq, _type_elem_eq, _instance_elem_eq)
+_ELEM_REPR: Final[ElemDispatch] = ElemDispatch(
+    repr, _type_elem_repr, _instance_elem_repr
+)
+
+
+def _expr(tree: Tree[T]) -> tuple[Aliases, SibElem, OrdElem]:
+    # Builds the single expr of a canonical tree with no Ors, from an explicit
+    # post-order walk, like canonical_nf, so that deep trees cannot exhaust the
+    # stack. Each frame is a tree to visit or, when combine is set, a Fork whose
+    # elems' Sib and Ord elems are on the end of results and are to be combined.
+    aliases: Aliases = {}
+    results: list[tuple[SibElem, OrdElem]] = []
+    stack: list[tuple[Tree[T], bool]] = [(tree, False)]
+    pop, push, push_all = stack.pop, stack.append, stack.extend
+    emit = results.append
+    while stack:
+        tree, combine = pop()
+        kind = tree.kind
+        if kind == BRANCH:
+            _id = tree.id  # type: ignore[attr-defined]
+            aliases[_id] = tree  # type: ignore[assignment]
+            emit((_id, _id))
+        elif kind == OR:
+            msg = f"to_exprs found an Or within a Fork; {tree} is not canonical"
+            raise ValueError(msg)
+        elif combine:
+            start = len(results) - len(tree)
+            elems = results[start:]
+            del results[start:]
+            head = Sib(tree.loc, *(s for s, _ in elems))  # type: ignore[attr-defined]
+            emit((head, tree.order(*(o for _, o in elems))))  # type: ignore[attr-defined]
+        else:
+            push((tree, True))
+            push_all((e, False) for e in reversed(tree._items))
+    [(sib, o)] = results
+    return aliases, sib, o
+
+
+def _leaf_tree(branch: Branch[T]) -> Tree[T]:
+    return branch
+
+
+def _combine_trees(fork: Tree[T], norms: list[Tree[T]], loc: int) -> Tree[T]:
+    return fork._combine(norms, loc)  # type: ignore[attr-defined]
+
+
+def _leaf_exprs(branch: Branch[T]) -> list[Expr]:
+    _id = branch.id
+    return [({_id: branch}, _id, _id)]
+
+
+def _combine_exprs(fork: Tree[T], norms: list[list[Expr]], loc: int) -> list[Expr]:
+    # Combines the exprs of the normalised elems of a Fork, one expr for each
+    # of their disjuncts, as Fork._combine does their trees. An Or's disjuncts
+    # are those of its elems in turn, and those of an And or Then are the
+    # product of its elems' disjuncts, as in _disjunctive_normalise.
+    if fork.kind == OR:
+        return list(chain.from_iterable(norms))
+    order: type[Ord] = fork.order  # type: ignore[attr-defined]
+    # canonical_nf splices an elem into its parent iff both are Forks of the
+    # same type and loc, which shows in the elem's expr as a Sib of that loc and
+    # the same order type. Sib splices such Sibs itself, so only Ords need to be.
+    pools = [
+        [
+            (aliases, sib, [*o] if type(o) is order and _sib_loc(sib) == loc else [o])
+            for aliases, sib, o in exprs
+        ]
+        for exprs in norms
+    ]
+    combined: list[Expr] = []
+    for disjunct in product(*pools):
+        aliases: Aliases = {}
+        for elem_aliases, _, _ in disjunct:
+            aliases.update(elem_aliases)
+        sib = Sib(loc, *(s for _, s, _ in disjunct))
+        combined.append(
+            (aliases, sib, order(*chain.from_iterable(o for _, _, o in disjunct)))
+        )
+    return combined
+
+
+def _sib_loc(sib: SibElem) -> int | None:
+    return sib.loc if isinstance(sib, Sib) else None
 
 
 def compile_tree(t: Tree) -> Iterator[tuple[Aliases, SibElem, OrdElem]]:
-    return t.canonical_nf().to_exprs()
+    return t.normalise_and_emit()
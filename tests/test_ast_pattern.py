@@ -33,6 +33,12 @@ class Test_ast_strict_equals:
     def test_ast_strict_equals_9(self):
         assert not ast_strict_equals(ast.And, ast.expr)
 
+    def test_ast_strict_equals_10(self):
+        assert not ast_strict_equals(ast.Name(id="a"), ast.Name(id="a", ctx=ast.Load))
+
+    def test_ast_strict_equals_11(self):
+        assert not ast_strict_equals(ast.Name(id="a"), ast.Name(ctx="a"))
+
 
 class TestToPattern:
     def test_tag_to_pattern_1(self):
@@ -104,6 +110,13 @@ class TestToPattern:
         )
         assert expand == expected
 
+    def test_ast_to_pattern_8(self):
+        class Sub(ast.Name):
+            pass
+
+        expand = to_pattern(Sub(id=str, ctx=ast.Store))
+        assert expand == Branch(Sub(id=str), And(Tag("ctx", ast.Store)))
+
     def test_to_pattern_8(self):
         unexpanded = Branch(
             ast.FunctionDef,
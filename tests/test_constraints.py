@@ -1,3 +1,4 @@
+import sys
 from operast.constraints import *
 
 
@@ -19,6 +20,27 @@ class TestSibling:
         result = [Sib(0, "A", "B"), Sib(1, "A", "D"), Sib(1, "B", "C")]
         assert constrained == result
 
+    def test_sibling_constraint_shared(self):
+        nested = Sib(1, "B", Sib(2, "C", "D"))
+        sib1 = Sib(0, "A", nested)
+        sib2 = Sib(0, "E", nested)
+        expected = [Sib(1, "B", "C"), Sib(2, "C", "D")]
+        assert sib1.constraint() == [Sib(0, "A", "B"), *expected]
+        assert sib2.constraint() == [Sib(0, "E", "B"), *expected]
+
+    def test_sibling_constraint_deep(self):
+        depth = 2 * sys.getrecursionlimit()
+        sib = Sib(depth, "A", "B")
+        for loc in reversed(range(depth)):
+            sib = Sib(loc, sib, f"C{loc}")
+        constrained = sib.constraint()
+        assert len(constrained) == depth + 1
+        assert constrained[0] == Sib(0, "A", "C0")
+        assert constrained[-1] == Sib(depth, "A", "B")
+
+    def test_sibling_constraint_empty(self):
+        assert Sib(0).constraint() == [Sib(0)]
+
     def test_sib_equals(self):
         sib1 = Sib(0, "A", "B")
         sib2 = Sib(1, "A", "B")
@@ -28,6 +50,8 @@ class TestSibling:
         assert sib1 == sib4
         assert sib1 != sib2 != sib3
         assert sib1 != Total("A", "B")
+        assert sib1 != Sib(0, "A", "B", "C")
+        assert Sib(0, "A", Sib(1, "B")) != Sib(0, "A", Sib(1, "C"))
 
     def test_sib_init_flatten(self):
         sib1 = Sib(0, "A", Sib(0, "B", "C"))
@@ -143,3 +167,19 @@ class TestOrdered:
         assert t1 == t2
         assert p1 == p2
         assert t1 != t3 != p1 != p3
+
+    def test_ord_dag_int_labels(self):
+        dag = Total(0, Partial(1, Total(2, 3)), 4).to_dag()
+        result = {0: {1, 2}, 1: {4}, 2: {3}, 3: {4}, 4: set()}
+        assert dag == result
+
+    def test_ord_dag_wide(self):
+        # With 10 ** 12 paths, this is only tractable without enumerating them.
+        layers = [[f"{i}_{j}" for j in range(10)] for i in range(12)]
+        dag = Total(*(Partial(*layer) for layer in layers)).to_dag()
+        result = {
+            label: set(layers[i + 1]) if i + 1 < len(layers) else set()
+            for i, layer in enumerate(layers)
+            for label in layer
+        }
+        assert dag == result
@@ -0,0 +1,30 @@
+from operast._ext import *
+
+
+class Base:
+    pass
+
+
+class Derived(Base):
+    pass
+
+
+def ext_eq(a: Base, b: object) -> bool:
+    return isinstance(b, Base)
+
+
+def ext_repr(a: Base) -> str:
+    return "Base"
+
+
+class TestExternMethods:
+    def test_register_invalidates_resolved(self):
+        assert get_ext_eq(Derived) is Derived.__eq__
+        register_extern_methods(Base, ExternMethods(eq=ext_eq, repr=ext_repr))
+        assert get_ext_eq(Derived) is ext_eq
+        assert get_ext_repr(Derived) is ext_repr
+        del EXTERN_METHODS[Base]
+
+    def test_immutable_class(self):
+        assert get_ext_eq(str) is str.__eq__
+        assert get_ext_repr(str) is str.__repr__
@@ -88,6 +88,12 @@ def test_has_children():
 
     assert not result2
 
+    list_children = ast.FunctionDef(name="a", body=["b", ast.Return()])
+    assert operast2._has_children(list_children, Scope())
+
+    no_list_children = ast.FunctionDef(name="a", body=["b"], decorator_list=[])
+    assert not operast2._has_children(no_list_children, Scope())
+
 
 def test_check_class():
     node = ast.Name()
@@ -143,6 +149,35 @@ def test_conjoin_n():
     assert not result4
 
 
+def test_compose_n_arities():
+    def outer_func(*nums: int) -> int:
+        return sum(nums)
+
+    def inner_func(num: int) -> int:
+        return num * 3
+
+    assert operast2.compose_n(outer_func, inner_func)(num=2) == 6
+    assert operast2.compose_n(outer_func, inner_func, inner_func)(num=2) == 12
+
+
+def test_conjoin_n_two():
+    calls = []
+
+    def func1(num: int) -> bool:
+        calls.append(1)
+        return num > 3
+
+    def func2(num: int) -> bool:
+        calls.append(2)
+        return num < 6
+
+    conjoined = operast2.conjoin_n(func1, func2)
+    assert conjoined(num=4)
+    assert not conjoined(num=10)
+    assert not conjoined(num=2)
+    assert calls == [1, 2, 1, 2, 1]
+
+
 def test_node_identity():
     # noinspection PyUnusedLocal
     def name_in_set(value: Any, scope: Scope) -> bool:
@@ -1,3 +1,4 @@
+from operast._ext import EXTERN_METHODS, ExternMethods, register_extern_methods
 from operast.operator import *
 from operast.thompson import *
 from operast.tree import And
@@ -13,6 +14,59 @@ class TestOp:
         assert s1 == s2
         assert s1 != s3 != pat
 
+    def test_hash(self):
+        assert hash(Plus("A")) == hash(Plus("A"))
+        assert hash(Alt(["A"], ["B"])) == hash(Alt(["A"], ["B"]))
+        assert len({Plus("A"), Plus("A"), Star("A"), Dot(), Dot()}) == 3
+
+    def test_hash_after_elems_reassigned(self):
+        s1, s2 = Plus("A"), Plus("B")
+        s2.elems[0] = "A"
+        assert s1 == s2
+        assert hash(s1) == hash(s2)
+
+    def test_equals_after_register(self):
+        class Elem:
+            def __eq__(self, other: object) -> bool:
+                return self is other
+
+            __hash__ = object.__hash__
+
+        s1, s2 = Plus(Elem()), Plus(Elem())
+        alt1, alt2 = Alt([Elem()], ["A"]), Alt([Elem()], ["A"])
+        assert s1 != s2
+        register_extern_methods(
+            Elem, ExternMethods(eq=lambda a, b: isinstance(b, Elem), repr=repr)
+        )
+        assert s1 == s2
+        assert alt1 == alt2
+        del EXTERN_METHODS[Elem]
+
+    def test_hash_after_register(self):
+        class Elem:
+            def __eq__(self, other: object) -> bool:
+                return self is other
+
+            __hash__ = object.__hash__
+
+        def pairs() -> list[tuple[Op, Op]]:
+            return [
+                (Plus(Elem()), Plus(Elem())),
+                (Alt([Elem()], ["A"]), Alt([Elem()], ["A"])),
+                (Lst(Elem(), "A"), Lst(Elem(), "A")),
+                (Repeat(Star(Elem()), count=2), Repeat(Star(Elem()), count=2)),
+            ]
+
+        before = pairs()
+        register_extern_methods(
+            Elem, ExternMethods(eq=lambda a, b: isinstance(b, Elem), repr=repr)
+        )
+        for a, b in [*before, *pairs()]:
+            assert a == b
+            assert hash(a) == hash(b)
+            assert len({a, b}) == 1
+        del EXTERN_METHODS[Elem]
+
 
 class TestCompile:
     # ab?c
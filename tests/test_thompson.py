@@ -1,3 +1,5 @@
+import pytest
+from operast import thompson
 from operast.thompson import *
 
 
@@ -141,3 +143,160 @@ class TestThompsonVM:
         assert thompson_str(program, "aP")
         assert not thompson_str(program, "abcdef")
         assert thompson_str(program, "abcdefP")
+
+    # (a*)*b, whose Splits and Jumps form an epsilon cycle
+    def test_epsilon_cycle_1(self):
+        program = [
+            Split(1, 5),
+            Split(2, 4),
+            Unit("a"),
+            Jump(1),
+            Jump(0),
+            Unit("b"),
+            Match(),
+        ]
+        assert thompson_str(program, "b")
+        assert thompson_str(program, "aab")
+        assert not thompson_str(program, "aa")
+        assert not thompson_str(program, "ac")
+
+    # ab*c, over an iterator rather than a list
+    def test_iterable_1(self):
+        program = [Unit("a"), Split(2, 4), Unit("b"), Jump(1), Unit("c"), Match()]
+        assert thompson_vm(program, iter("abbc"), str.__eq__)
+        assert not thompson_vm(program, (c for c in "abb"), str.__eq__)
+        assert not thompson_vm(program, iter(""), str.__eq__)
+
+
+class TestCompileProgram:
+    def test_compile_program(self):
+        program = [Unit("a"), UnitList(["b"]), AnyUnit(), Jump(4), Split(0, 5), Match()]
+        ops, args, closures = compile_program(program)
+        assert ops == [inst.opcode for inst in program]
+        assert args == ["a", ("b",), None, 4, (0, 5), None]
+        assert closures == [(0,), (1,), (2,), (0, 5), (0, 5), (5,)]
+
+    def test_unit_lists_shared(self):
+        b, c = "b", "c"
+        program = [UnitList([b, c]), UnitList([b, c]), UnitList([c, b]), Match()]
+        _, args, _ = compile_program(program)
+        assert args[0] is args[1]
+        assert args[0] is not args[2]
+
+    def test_epsilon_closure(self):
+        # (a*)*b
+        program = [Split(1, 5), Split(2, 4), Unit("a"), Jump(1), Jump(0), Unit("b")]
+        ops, args, closures = compile_program(program)
+        assert closures[0] == (2, 5)
+        assert closures[3] == (2, 5)
+        assert epsilon_closure(ops, args, 4) == (2, 5)
+
+    def test_vm_step_no_threads(self):
+        program: list[Instruction[str]] = [Unit("a"), Match()]
+        assert vm_step(program, [], "a", str.__eq__) == []
+        assert vm_step(program, [0], "a", str.__eq__) == [1]
+        assert vm_step(program, [1], "a", str.__eq__) is None
+
+    # a*b
+    def test_vm_step_epsilon(self):
+        program = [Split(1, 3), Unit("a"), Jump(0), Unit("b"), Match()]
+        assert vm_step(program, [0], "a", str.__eq__) == [1, 3]
+        assert vm_step(program, [2], "b", str.__eq__) == [4]
+        assert vm_step(program, [0, 2, 1], "x", str.__eq__) == []
+        assert vm_step(program, [4], "x", str.__eq__) is None
+
+    def test_vm_step_program_changed(self):
+        program: list[Instruction[str]] = [Unit("a"), Match()]
+        assert vm_step(program, [0], "b", str.__eq__) == []
+        program[0] = Unit("b")
+        assert vm_step(program, [0], "b", str.__eq__) == [1]
+
+    def test_vm_step_not_epsilon_closed(self):
+        program = compile_program([Split(1, 2), Unit("a"), Jump(0), Match()])
+        with pytest.raises(ValueError):
+            thompson._vm_step(program, [0], "a", str.__eq__)
+        with pytest.raises(ValueError):
+            thompson._vm_step(program, [2], "a", str.__eq__)
+
+
+class TestLazyDFA:
+    # a(b|c)*d
+    def test_match(self):
+        program = [
+            Unit("a"),
+            Split(2, 7),
+            Split(3, 5),
+            Unit("b"),
+            Jump(6),
+            Unit("c"),
+            Jump(1),
+            Unit("d"),
+            Match(),
+        ]
+        dfa = LazyDFA(program, str.__eq__)
+        for in_ in ["a", "ab", "abd", "abbbd", "acd", "abcbd", "ad", "abcx", ""]:
+            assert dfa.match(list(in_)) == thompson_str(program, in_)
+        # Repeat matches are answered from the cached transitions.
+        transitions = len(dfa._transitions)
+        assert dfa.match(list("abcbd"))
+        assert len(dfa._transitions) == transitions
+
+    # a[bc]d, with items keyed by their lowercase form
+    def test_key(self):
+        program = [Unit("a"), UnitList(["b", "c"]), Unit("d"), Match()]
+        dfa = LazyDFA(program, lambda x, y: x.lower() == y, key=str.lower)
+        assert dfa.match(list("aBd"))
+        assert dfa.match(list("abd"))
+        assert not dfa.match(list("aXd"))
+
+    def test_max_transitions(self):
+        program = [AnyUnit(), Split(0, 2), Unit("P"), Match()]
+        dfa = LazyDFA(program, str.__eq__, max_transitions=2)
+        for in_ in ["aP", "abcdefP", "xyzP"]:
+            assert dfa.match(list(in_))
+        assert not dfa.match(list("abcdef"))
+
+    def test_max_transitions_within_match(self):
+        # .+P
+        program = [AnyUnit(), Split(0, 2), Unit("P"), Match()]
+        dfa = LazyDFA(program, str.__eq__, max_transitions=3)
+        in_ = [str(i) for i in range(1000)]
+        assert dfa.match([*in_, "P"])
+        assert len(dfa._transitions) <= 3
+        assert not dfa.match(in_)
+        assert len(dfa._transitions) <= 3
+        assert len(dfa._states) <= 4
+
+
+class TestCompileMatcher:
+    @pytest.mark.parametrize(
+        "program",
+        [
+            # ab?c
+            [Unit("a"), Split(2, 3), Unit("b"), Unit("c"), Match()],
+            # a+b+
+            [Unit("a"), Split(0, 2), Unit("b"), Split(2, 4), Match()],
+            # a[bc]d
+            [Unit("a"), UnitList(["b", "c"]), Unit("d"), Match()],
+            # a(b|c)*d
+            [
+                Unit("a"),
+                Split(2, 7),
+                Split(3, 5),
+                Unit("b"),
+                Jump(6),
+                Unit("c"),
+                Jump(1),
+                Unit("d"),
+                Match(),
+            ],
+            # .+P
+            [AnyUnit(), Split(0, 2), Unit("P"), Match()],
+            # (a*)*b
+            [Split(1, 5), Split(2, 4), Unit("a"), Jump(1), Jump(0), Unit("b"), Match()],
+        ],
+    )
+    def test_matches_vm(self, program):
+        matcher = compile_matcher(program)
+        for in_ in ["", "a", "ab", "ac", "abc", "abd", "acd", "abbc", "abcbd", "aP"]:
+            assert matcher(in_, str.__eq__) == thompson_str(program, in_)
@@ -1,5 +1,7 @@
 import pytest
+import sys
 from operast.constraints import Partial, Sib, Total
+from operast.operator import Star
 from operast.tree import *
 
 
@@ -238,6 +240,12 @@ class TestCanonicalNormalForm:
 
         assert or_count == 1
 
+    def test_canonical_nf_does_not_mutate(self):
+        pat = Branch("A", And("B", Branch("C", Or("D", "E"))))
+        result = pat.canonical_nf()
+        assert pat == Branch("A", And("B", Branch("C", Or("D", "E"))))
+        assert pat.canonical_nf() == result
+
 
 # .to_exprs must only be called after .canonical_nf has been called
 #
@@ -246,40 +254,40 @@ class TestToExpression:
     def test_Branch_simple_to_expr(self):
         tp = Branch("A", "B", "C").canonical_nf()
         aliases, sib, ord_ = next(tp.to_exprs())
-        assert aliases == {"B0": Branch("A", "B", "C")}
-        assert sib == "B0"
-        assert ord_ == "B0"
+        assert aliases == {0: Branch("A", "B", "C")}
+        assert sib == 0
+        assert ord_ == 0
 
     def test_And_simple_to_expr(self):
         tp = And("A", "B", "C").canonical_nf()
         aliases, sib, ord_ = next(tp.to_exprs())
-        assert aliases == {"B0": Branch("A"), "B1": Branch("B"), "B2": Branch("C")}
-        assert sib == Sib(0, "B0", "B1", "B2")
-        assert ord_ == Partial("B0", "B1", "B2")
+        assert aliases == {0: Branch("A"), 1: Branch("B"), 2: Branch("C")}
+        assert sib == Sib(0, 0, 1, 2)
+        assert ord_ == Partial(0, 1, 2)
 
     def test_Then_simple_to_expr(self):
         tp = Then("A", "B", "C").canonical_nf()
         aliases, sib, ord_ = next(tp.to_exprs())
-        assert aliases == {"B0": Branch("A"), "B1": Branch("B"), "B2": Branch("C")}
-        assert sib == Sib(0, "B0", "B1", "B2")
-        assert ord_ == Total("B0", "B1", "B2")
+        assert aliases == {0: Branch("A"), 1: Branch("B"), 2: Branch("C")}
+        assert sib == Sib(0, 0, 1, 2)
+        assert ord_ == Total(0, 1, 2)
 
     def test_Or_simple_to_expr(self):
         tp = Or("A", "B", "C").canonical_nf()
         for i, (aliases, sib, ord_) in enumerate(tp.to_exprs()):
-            assert aliases == {f"B{i}": Branch(tp[i])}
-            assert sib == f"B{i}"
-            assert ord_ == f"B{i}"
+            assert aliases == {i: Branch(tp[i])}
+            assert sib == i
+            assert ord_ == i
 
     def test_complex_to_expr_1(self):
         tp = Branch("A", "B", And("C", Branch("D", "E"))).canonical_nf()
         aliases, sib, ord_ = next(tp.to_exprs())
         assert aliases == {
-            "B1": Branch("A", "B", "C"),
-            "B0": Branch("A", "B", "D", "E"),
+            1: Branch("A", "B", "C"),
+            0: Branch("A", "B", "D", "E"),
         }
-        assert sib == Sib(2, "B1", "B0")
-        assert ord_ == Partial("B1", "B0")
+        assert sib == Sib(2, 1, 0)
+        assert ord_ == Partial(1, 0)
 
     def test_complex_to_expr_2(self):
         tp = Branch(
@@ -290,22 +298,99 @@ class TestToExpression:
 
         alias0, sib0, ord0 = result[0]
         assert alias0 == {
-            "B4": Branch("A", "B", "C"),
-            "B2": Branch("A", "B", "D", "E"),
-            "B5": Branch("A", "B", "X"),
+            4: Branch("A", "B", "C"),
+            2: Branch("A", "B", "D", "E"),
+            5: Branch("A", "B", "X"),
         }
-        assert sib0 == Sib(2, "B4", "B2", "B5")
-        assert ord0 == Partial("B4", "B2", "B5")
+        assert sib0 == Sib(2, 4, 2, 5)
+        assert ord0 == Partial(4, 2, 5)
 
         alias1, sib1, ord1 = result[1]
         assert alias1 == {
-            "B4": Branch("A", "B", "C"),
-            "B0": Branch("A", "B", "D", "F"),
-            "B1": Branch("A", "B", "D", "G"),
-            "B5": Branch("A", "B", "X"),
+            4: Branch("A", "B", "C"),
+            0: Branch("A", "B", "D", "F"),
+            1: Branch("A", "B", "D", "G"),
+            5: Branch("A", "B", "X"),
         }
-        assert sib1 == Sib(2, "B4", Sib(3, "B0", "B1"), "B5")
-        assert ord1 == Partial("B4", Total("B0", "B1"), "B5")
+        assert sib1 == Sib(2, 4, Sib(3, 0, 1), 5)
+        assert ord1 == Partial(4, Total(0, 1), 5)
+
+    def test_to_exprs_repeated(self):
+        tp = And("A", Branch("B", Or("C", Then("D", "E")))).canonical_nf()
+        first = list(tp.to_exprs())
+        assert len(first) == 2
+        assert list(tp.to_exprs()) == first
+
+    def test_to_exprs_after_setitem(self):
+        tp = And("A", "B").canonical_nf()
+        list(tp.to_exprs())
+        tp[1] = "C"
+        aliases, sib, ord_ = next(tp.to_exprs())
+        assert aliases == {0: Branch("A"), 2: Branch("C")}
+        assert sib == Sib(0, 0, 2)
+        assert ord_ == Partial(0, 2)
+
+        nested = And("A", Branch("B", Then("C", "D"))).canonical_nf()
+        list(nested.to_exprs())
+        nested[1][1] = "E"
+        aliases, sib, ord_ = next(nested.to_exprs())
+        assert aliases[max(aliases)] == Branch("E")
+        assert Branch("B", "D") not in aliases.values()
+
+    def test_to_exprs_shared_subtree(self):
+        shared = Branch("X")
+        tree = And(Branch("A", shared), Branch("C", shared))
+        [(aliases, sib, ord_)] = tree.canonical_nf().to_exprs()
+        assert sorted(aliases.values(), key=repr) == [
+            Branch("A", "X"),
+            Branch("C", "X"),
+        ]
+        assert sib == Sib(0, *aliases)
+        assert ord_ == Partial(*aliases)
+
+        [(aliases, sib, _)] = And(shared, shared).canonical_nf().to_exprs()
+        assert list(aliases.values()) == [Branch("X"), Branch("X")]
+        assert sib == Sib(0, *aliases)
+
+
+def shared_subtree(shared: Branch[str]) -> Tree[str]:
+    return And[str](Branch("A", shared), Or[str](Branch("C", shared), shared))
+
+
+# compile_tree emits exprs during normalisation, and so must agree with the
+# two pass canonical_nf().to_exprs()
+class TestCompileTree:
+    @pytest.mark.parametrize(
+        "make",
+        [
+            lambda: Branch("A", "B", "C"),
+            lambda: And("A", Then("B", "C"), Or("D", And("E", "F"))),
+            lambda: Branch("A", "B", And("C", Branch("D", "E"))),
+            lambda: Branch(
+                "A", "B", And("C", Branch("D", Or("E", Then("F", "G"))), "X")
+            ),
+            lambda: Then[str](Or("A", "B"), Branch("C", Or("D", Then("E", "F")))),
+            lambda: And("A", Or("B", "C", "B"), Or(Branch("D"), And("D"))),
+            lambda: shared_subtree(Branch("X")),
+        ],
+    )
+    def test_compile_tree_matches_two_pass(self, make):
+        expected = list(make().canonical_nf().to_exprs())
+        Branch.id_count = 0
+        assert list(compile_tree(make())) == expected
+
+    def test_compile_tree_deep(self):
+        depth = 2 * sys.getrecursionlimit()
+        tree = Branch("A")
+        for _ in range(depth):
+            tree = And("B", Branch("C", tree))
+        [(aliases, sib, _)] = compile_tree(tree)
+        assert len(aliases) == depth + 1
+        assert len(sib.constraint()) == depth
+
+    def test_to_exprs_not_canonical(self):
+        with pytest.raises(ValueError):
+            list(And("A", Or("B", "C")).to_exprs())
 
 
 # noinspection PyPep8Naming
@@ -321,3 +406,63 @@ class TestBranch:
 
         with pytest.raises(ValueError):
             Branch(Branch("A"), "B")
+
+    def test_label(self):
+        assert Branch("A").label == "B0"
+        assert Branch("B").label == "B1"
+
+    def test_no_instance_dict(self):
+        for tree in (Branch("A"), And("A", "B"), Then("A", "B"), Or("A", "B")):
+            assert not hasattr(tree, "__dict__")
+
+
+class TestTreeElemEq:
+    def test_elem_kinds(self):
+        assert Branch("A", And(Star("B"), 1)) == Branch("A", And(Star("B"), 1))
+        assert Branch("A", And(Star("B"), 1)) != Branch("A", And(Star("C"), 1))
+        assert repr(Branch(1, "A")) == "Branch(1, 'A')"
+
+
+class TestFork:
+    def test_setitem(self):
+        tree = And("A", "B")
+        tree[1] = Or("B", "C")
+        assert tree == And("A", Or("B", "C"))
+        assert tree.canonical_nf() == Or(And("A", "B"), And("A", "C"))
+        tree[1] = "C"
+        assert tree == And("A", Branch("C"))
+        assert tree.canonical_nf() == And("A", "C")
+
+    def test_canonical_nf_deep(self):
+        depth = 2 * sys.getrecursionlimit()
+        tree = Branch("A")
+        for _ in range(depth):
+            tree = And("B", Branch("C", tree))
+        assert isinstance(tree.canonical_nf(), And)
+
+    def test_canonical_nf_single_or(self):
+        tree = Then("A", Or("B", Then("C", "D"), And("E", "F")), "G")
+        assert tree.canonical_nf() == Or(
+            Then("A", "B", "G"),
+            Then("A", "C", "D", "G"),
+            Then("A", And("E", "F"), "G"),
+        )
+
+    def test_eq_deep(self):
+        def build(leaf: str) -> Tree:
+            tree: Tree = Branch(leaf)
+            for _ in range(2 * sys.getrecursionlimit()):
+                tree = And("B", Branch("C", tree))
+            return tree
+
+        assert build("A") == build("A")
+        assert build("A") != build("D")
+
+    def test_canonical_nf_distinct_or(self):
+        assert Or("A", "A").canonical_nf() == Branch("A")
+        assert Or("A", "B", "A").canonical_nf() == Or("A", "B")
+        assert And("A", Or("B", "B")).canonical_nf() == And("A", "B")
+        # Forks are only deduplicated by identity, since equality ignores loc.
+        assert Or(And("A", "B"), And("A", "B")).canonical_nf() == Or(
+            And("A", "B"), And("A", "B")
+        )